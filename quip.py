@@ -132,7 +132,7 @@ class QuipClient(object):
         BLUE = range(5)
 
     def __init__(self, access_token=None, client_id=None, client_secret=None,
-                 base_url=None, request_timeout=None):
+                 base_url=None, request_timeout=None, session=None):
         """Constructs a Quip API client.
 
         If `access_token` is given, all of the API methods in the client
@@ -141,12 +141,17 @@ class QuipClient(object):
         Otherwise, only `get_authorization_url` and `get_access_token`
         work, and we assume the client is for a server using the Quip API's
         OAuth endpoint.
+
+        If `session` is given (a `requests.Session`), API calls are sent
+        through it so that connections are kept alive and reused between
+        calls. Otherwise each call opens a new connection via `urlopen`.
         """
         self.access_token = access_token
         self.client_id = client_id
         self.client_secret = client_secret
         self.base_url = base_url if base_url else "https://platform.quip.com"
         self.request_timeout = request_timeout if request_timeout else 10
+        self.session = session
 
     def get_authorization_url(self, redirect_uri, state=None):
         """Returns the URL the user should be redirected to to sign in."""
@@ -814,6 +819,8 @@ class QuipClient(object):
         return self._fetch_json("websockets/new", **kwargs)
 
     def _fetch_json(self, path, post_data=None, **args):
+        if self.session is not None:
+            return self._fetch_json_with_session(path, post_data, **args)
         request = Request(url=self._url(path, **args))
         if post_data:
             post_data = dict((k, v) for k, v in post_data.items()
@@ -838,6 +845,30 @@ class QuipClient(object):
                 raise error
             raise QuipError(error.code, message, error)
 
+    def _fetch_json_with_session(self, path, post_data=None, **args):
+        import requests
+        headers = None
+        if self.access_token:
+            headers = {"Authorization": "Bearer " + self.access_token}
+        data = None
+        if post_data:
+            post_data = dict((k, v) for k, v in post_data.items()
+                             if v or isinstance(v, int))
+            data = self._clean(**post_data)
+        try:
+            response = self.session.request(
+                "post" if data is not None else "get", self._url(path, **args),
+                data=data, headers=headers, timeout=self.request_timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.HTTPError as error:
+            try:
+                # Extract the developer-friendly error message from the response
+                message = error.response.json()["error_description"]
+            except Exception:
+                raise error
+            raise QuipError(error.response.status_code, message, error)
+
     def _clean(self, **args):
         return dict((k, str(v) if isinstance(v, int) else v.encode("utf-8"))
                     for k, v in args.items() if v or isinstance(v, int))
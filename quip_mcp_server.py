@@ -1,11 +1,15 @@
 # Copyright 2025 Amazon.com, Inc. or its affiliates. All Rights Reserved.
 
 import quip
-import os, json, datetime
-import html, unicodedata, re
-from markdownify import markdownify as md
+import orjson
+import os, asyncio, datetime, functools, itertools, threading
+import html, unicodedata
 from mcp.server.fastmcp import FastMCP
-from bs4 import BeautifulSoup
+import lxml.etree, lxml.html
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import TTLCache
 
 
 # Get token from environment variables
@@ -14,21 +18,115 @@ base_url = os.environ.get('QUIP_BASE_URL', "https://platform.quip-amazon.com")
 
 mcp = FastMCP("quip-browse-server")
 
+# Maximum number of messages the Quip API returns per get_messages call
+MESSAGES_PAGE_SIZE = 100
+
+# Sentinel for cache misses, since a cached response may itself be falsy
+_MISSING = object()
+
+
+class CachingQuipClient(quip.QuipClient):
+    """
+    Quip client that keeps read-only thread, user and message lookups for a short TTL.
+    Tools called in the same session often ask about the same thread or users; repeated lookups are
+    served from memory instead of the Quip API. Call invalidate_thread after changing a thread.
+    """
+
+    def __init__(self, *args, cache_maxsize=128, cache_ttl=60, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache = TTLCache(maxsize=cache_maxsize, ttl=cache_ttl)
+        self._cache_lock = threading.Lock()
+        # Bumped by invalidate_thread, so fetches that started before an invalidation are not stored
+        self._thread_generations = {}
+
+    def _cached(self, key, fetch, thread_id=None):
+        with self._cache_lock:
+            value = self._cache.get(key, _MISSING)
+            generation = self._thread_generations.get(thread_id, 0)
+        if value is not _MISSING:
+            return value
+        value = fetch()
+        with self._cache_lock:
+            # A response fetched across an invalidation may predate the change, so don't keep it
+            if self._thread_generations.get(thread_id, 0) == generation:
+                self._cache[key] = value
+        return value
+
+    def get_thread(self, id):
+        return self._cached(("get_thread", id), functools.partial(super().get_thread, id), thread_id=id)
+
+    def get_user(self, id):
+        return self._cached(("get_user", id), functools.partial(super().get_user, id))
+
+    def get_users(self, ids):
+        return self._cached(("get_users", tuple(ids)), functools.partial(super().get_users, ids))
+
+    def get_messages(self, thread_id, max_created_usec=None, count=None):
+        return self._cached(
+            ("get_messages", thread_id, max_created_usec, count),
+            functools.partial(super().get_messages, thread_id, max_created_usec=max_created_usec, count=count),
+            thread_id=thread_id
+        )
+
+    def invalidate_thread(self, thread_id):
+        """Drop cached thread and message lookups for thread_id, e.g. after its members changed."""
+        with self._cache_lock:
+            self._thread_generations[thread_id] = self._thread_generations.get(thread_id, 0) + 1
+            for key in [k for k in self._cache if k[0] in ("get_thread", "get_messages") and k[1] == thread_id]:
+                self._cache.pop(key, None)
+
+
+def init_http_session():
+    """
+    Create a requests session with a keep-alive connection pool for the Quip API.
+    Connections to the Quip host are reused across API calls instead of paying a TCP + TLS
+    handshake per request, and idempotent requests are retried on transient failures.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=50,
+        max_retries=Retry(total=3, backoff_factor=0.3)
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+_quip_client = None
+_quip_client_lock = threading.Lock()
+
 
 def init_quip_client():
     """
     Initialize and return a Quip client instance.
     Gets access token and base URL from environment variables, creates an authenticated Quip client,
     verifies authentication status and returns a usable client object.
+    The client is created and authenticated once per process; later calls return the cached instance.
+    """
+    global _quip_client
+    if _quip_client is not None:
+        return _quip_client
+    # Concurrent first tool calls wait here, so only one of them creates and authenticates the client
+    with _quip_client_lock:
+        if _quip_client is None:
+            _quip_client = create_quip_client()
+    return _quip_client
+
+
+def create_quip_client():
+    """
+    Create a new authenticated Quip client instance.
+    Use init_quip_client to get the client shared by all tool calls.
     """
     
     if not access_token or not base_url:
         raise ValueError("QUIP_ACCESS_TOKEN environment variable is required")
 
-    client = quip.QuipClient(
+    client = CachingQuipClient(
         access_token=access_token,
         base_url=base_url,
-        request_timeout=20  # Increased timeout
+        request_timeout=20,  # Increased timeout
+        session=init_http_session()
     )
 
     # Verify authentication
@@ -46,7 +144,11 @@ def get_document_content(thread_id):
     """
     Retrieve document content for a specified thread.
     Returns a JSON string containing thread ID, type, title, and HTML content converted to Markdown format.
+    The HTML is parsed with lxml and the resulting tree handed to markdownify, which would otherwise
+    re-parse it with the slower html.parser.
     """
+    from markdownify import MarkdownConverter
+
     try:
         client = init_quip_client()
         doc = client.get_thread(thread_id)
@@ -55,73 +157,163 @@ def get_document_content(thread_id):
             "thread_id": thread["id"], 
             "thread_type": thread["type"],
             "thread_title": thread["title"],
-            "thread_html_content": md(doc['html'], heading_style="ATX")
+            "thread_html_content": MarkdownConverter(heading_style="ATX").convert_soup(parse_document_html_bs(doc['html']))
             }
-        return json.dumps(content)
+        return orjson.dumps(content).decode()
     except Exception as e:
         raise
 
 
-def get_username_by_id(id):
+def get_usernames_by_ids(ids):
     """
-    Get username by user ID.
-    Queries the Quip API to retrieve the username corresponding to the specified user ID.
+    Get usernames for a list of user IDs.
+    Resolves all IDs with a single bulk Quip API query and returns the usernames in the same order as ids.
     """
     try:
+        if not ids:
+            return []
         client = init_quip_client()
-        username = client.get_user(id)["name"]
-        return username
+        users = client.get_users(ids)
+        return [users[id]["name"] for id in ids]
     except Exception as e:
         raise
 
 
-def get_section_bs(section_id, thread_id=None, document_html=None):
-    """
-    Get a BeautifulSoup element for a specified section in the document.
-    Can retrieve document content by providing either document_html or thread_id.
-    Returns the HTML element object matching the section_id.
-    """
-    if not document_html:
-        client = init_quip_client()
-        document_html = client.get_thread(thread_id).get("html")
-        if not document_html:
-            return None
-    soup = parse_document_html_bs(document_html)
-    element = soup.find(id=section_id)
-    return element
+# Special whitespace characters replaced in a single pass by clean_extracted_text
+_SPECIAL_WHITESPACE = str.maketrans({
+    '\xa0': ' ',  # 不间断空格
+    '\u2009': ' ',  # 细空格
+    '\u200b': None,  # 零宽空格
+})
 
 
 def clean_extracted_text(text):
     """
-    Clean text content extracted from BeautifulSoup.
+    Clean text content extracted from the document HTML.
     Handles HTML entities, Unicode normalization, and removes special whitespace characters.
     Returns a cleaned plain text string.
     """
     if not text:
         return text
+    # Plain ASCII without entities has nothing to unescape, normalize or replace
+    if text.isascii() and '&' not in text:
+        return text.strip()
     
     text = html.unescape(text)
-    text = unicodedata.normalize('NFKD', text)
-    text = text.replace('\xa0', ' ')  # 不间断空格
-    text = text.replace('\u2009', ' ')  # 细空格
-    text = text.replace('\u200b', '')  # 零宽空格
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
     
-    return text.strip()
+    return text.translate(_SPECIAL_WHITESPACE).strip()
+
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def usec_to_datetime(usec):
+    """
+    Convert a Quip microsecond timestamp into a UTC datetime.
+    Uses exact integer arithmetic instead of float division, so no microseconds are lost to rounding.
+    """
+    return _EPOCH + datetime.timedelta(microseconds=usec)
 
 
 def parse_document_html_bs(document_html):
     """
     Parse Quip document HTML into a BeautifulSoup object.
-    Adds root HTML tags to the content and creates a parseable BeautifulSoup instance
-    for subsequent HTML element searching and content extraction.
+    Creates a parseable BeautifulSoup instance for subsequent HTML element searching and content extraction.
+    Uses the C-based lxml parser, which is much faster than the pure-Python html.parser and adds the
+    root HTML tags around the document fragment itself.
     """
-    document_html = "<html>" + document_html+ "</html>"
-    return BeautifulSoup(document_html, "html.parser")
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(document_html, "lxml")
+
+
+def parse_document_html_lxml(document_html):
+    """
+    Parse Quip document HTML into an lxml element tree.
+    Used where only id lookups and text extraction are needed, which lxml does natively in C
+    without building a BeautifulSoup tree on top.
+    """
+    return lxml.html.fromstring(document_html)
+
+
+# Every element of a document that carries an id, i.e. every addressable section
+_ELEMENTS_WITH_ID = lxml.etree.XPath("//*[@id]")
+
+
+def index_sections_by_id(tree):
+    """
+    Build a mapping from section id to lxml element for a parsed document.
+    Lets callers resolve many section ids with dict lookups instead of one tree walk per id.
+    If an id repeats, the first element in document order is kept, as a search by id would return.
+    """
+    index = {}
+    for element in _ELEMENTS_WITH_ID(tree):
+        index.setdefault(element.get("id"), element)
+    return index
+
+
+def fetch_sections_by_id(thread_id):
+    """
+    Download the document of a thread and index its sections by id.
+    The document is parsed once, so the sections referenced by any number of comments can be resolved with dict lookups.
+    """
+    client = init_quip_client()
+    document_html = client.get_thread(thread_id).get("html")
+    if not document_html:
+        return {}
+    try:
+        tree = parse_document_html_lxml(document_html)
+    except lxml.etree.ParserError:
+        # lxml rejects documents without any element, e.g. only whitespace or an HTML comment
+        return {}
+    return index_sections_by_id(tree)
+
+
+def format_comments(raw_comments, sections_by_id):
+    """
+    Format raw Quip messages into comment details.
+    Resolves the document section each comment refers to via sections_by_id and returns a list with reviewer,
+    content, reference, and creation and update times for every visible comment.
+    """
+    results = []
+    for comm in raw_comments:
+        if not comm.get("visible"):
+            continue
+        ann = comm.get("annotation")
+        created_usec = comm["created_usec"]
+        updated_usec = comm["updated_usec"]
+        reference = None
+        if ann:
+            hsids = ann.get("highlight_section_ids")
+            if hsids:
+                section = sections_by_id.get(hsids[0])
+                if section is not None:
+                    if "img" in section.tag:
+                        reference = section.get("alt")
+                    else:
+                        text = section.text_content()
+                        reference = clean_extracted_text(text) if text else None
+            elif ann.get("id"):
+                section = sections_by_id.get(ann["id"])
+                if section is not None:
+                    reference = clean_extracted_text(section.text_content())
+        created = usec_to_datetime(created_usec)
+        updated = created if updated_usec == created_usec else usec_to_datetime(updated_usec)
+        results.append({
+            "reviewer": comm.get("author_name"),
+            "comment_content": comm.get("text"),
+            "comment_on": reference,
+            "created:": created,
+            "last_updated": updated
+        })
+    return results
 
 
 
 @mcp.tool()
-def get_thread_metadata(thread_id):
+async def get_thread_metadata(thread_id):
     """Get metadata of a quip thread including its id, type, title, link, people who have access to the thread and their access levels by specifying the thread id..
     
     Args:
@@ -132,12 +324,14 @@ def get_thread_metadata(thread_id):
     """
     try:
         # Get thread data
-        client = init_quip_client()
-        response = client.get_thread(thread_id)
+        client = await asyncio.to_thread(init_quip_client)
+        response = await asyncio.to_thread(client.get_thread, thread_id)
         thread = response["thread"]
+        access_levels = response["access_levels"]
+        users = await asyncio.to_thread(client.get_users, list(access_levels)) if access_levels else {}
         thread_access = []
-        for uid, level in response["access_levels"].items():
-            user = client.get_user(uid)
+        for uid, level in access_levels.items():
+            user = users[uid]
             thread_access.append({
                 "name": user["name"],
                 "email": user["emails"][0],
@@ -151,13 +345,13 @@ def get_thread_metadata(thread_id):
             "thread_link": thread["link"],
             "thread_access": thread_access
             }
-        return json.dumps(meta_data)
+        return orjson.dumps(meta_data).decode()
     except Exception as e:
         raise
 
 
 @mcp.tool()
-def get_thread_content(thread_id):
+async def get_thread_content(thread_id):
     """Get content of a quip thread by specifying the thread id.
     
     Args:
@@ -166,11 +360,11 @@ def get_thread_content(thread_id):
     Returns:
         Content of the quip thread.
     """
-    return get_document_content(thread_id)
+    return await asyncio.to_thread(get_document_content, thread_id)
 
 
 @mcp.tool()
-def get_user_ids_by_emails(user_list):
+async def get_user_ids_by_emails(user_list):
     """Given emails of a group of users, get User IDs for these specified users. 
     
     Args:
@@ -180,19 +374,19 @@ def get_user_ids_by_emails(user_list):
         IDs of requested users.
     """    
     try:
-        client = init_quip_client()
-        user_profiles = client.get_users(user_list)
+        client = await asyncio.to_thread(init_quip_client)
+        user_profiles = await asyncio.to_thread(client.get_users, user_list)
         ids = {}
         for u in user_list:
             id_tmp = user_profiles[u]["id"]
             ids[f"User {u} ID"] = id_tmp
-        return json.dumps(ids)
+        return orjson.dumps(ids).decode()
     except Exception as e:
         raise
 
 
 @mcp.tool()
-def add_members_to_thread_with_access_level(thread_id, members_with_access_level):
+async def add_members_to_thread_with_access_level(thread_id, members_with_access_level):
     """Add access permissions to a thread to specified members, according to the specified access levels.
     
     Args:
@@ -203,17 +397,18 @@ def add_members_to_thread_with_access_level(thread_id, members_with_access_level
         A message showing the operation result.
     """    
     try:
-        client = init_quip_client()
-        client.add_thread_members_by_access_level(thread_id, members_with_access_level)
-        users = []
-        [users.extend(u["member_ids"]) for u in members_with_access_level]
-        return f"Permissions added for {", ".join([get_username_by_id(u) for u in users])}."
+        client = await asyncio.to_thread(init_quip_client)
+        await asyncio.to_thread(client.add_thread_members_by_access_level, thread_id, members_with_access_level)
+        client.invalidate_thread(thread_id)
+        users = list(itertools.chain.from_iterable(u["member_ids"] for u in members_with_access_level))
+        usernames = await asyncio.to_thread(get_usernames_by_ids, users)
+        return f"Permissions added for {', '.join(usernames)}."
     except Exception as e:
         raise
 
 
 @mcp.tool()
-def remove_members_access_from_thread(thread_id, members_to_remove):
+async def remove_members_access_from_thread(thread_id, members_to_remove):
     """Remove specified members' access to a thread.
     
     Args:
@@ -224,55 +419,64 @@ def remove_members_access_from_thread(thread_id, members_to_remove):
         A message showing the operation result.
     """    
     try:
-        client = init_quip_client()
-        client.remove_thread_members(thread_id, members_to_remove)
-        return f"Permissions for {", ".join([get_username_by_id(u) for u in members_to_remove])} removed."
+        client = await asyncio.to_thread(init_quip_client)
+        await asyncio.to_thread(client.remove_thread_members, thread_id, members_to_remove)
+        client.invalidate_thread(thread_id)
+        usernames = await asyncio.to_thread(get_usernames_by_ids, members_to_remove)
+        return f"Permissions for {', '.join(usernames)} removed."
     except Exception as e:
         raise
 
 
 @mcp.tool()
-def get_comments_from_thread(thread_id):
-    """Retrieve up to 100 comments from a specified Quip thread. 
+async def get_comments_from_thread(thread_id, max_comments: int = 100, since: int | None = None):
+    """Retrieve comments from a specified Quip thread, newest first, paging through the thread as needed. 
     
     Args:
         thread_id: an unique id of a thread in Quip, used to access a quip thread. For example, if a url of a quip thread is https://quip-amazon.com/AbcCFHsxcstk/AgentTest, then the thread id is AbcCFHsxcstk.
+        max_comments: The maximum number of comments to return. Defaults to 100.
+        since: Optional Unix timestamp in microseconds. If given, only comments created at or after this time are returned.
  
     Returns:
         Details of comments are returned, including reviewer, content and reference of the comment, recreation time of the comment for each comment.
     """ 
     try:
-        client = init_quip_client()
-        raw_comments = client.get_messages(thread_id, count=100)
-        document_html = client.get_thread(thread_id).get("html")
+        if max_comments < 1:
+            raise ValueError("max_comments must be at least 1")
+        client = await asyncio.to_thread(init_quip_client)
+        count = min(max_comments, MESSAGES_PAGE_SIZE)
+        # The first page and the document are independent, so fetch them concurrently over the pooled session
+        page, sections_by_id = await asyncio.gather(
+            asyncio.to_thread(client.get_messages, thread_id, count=count),
+            asyncio.to_thread(fetch_sections_by_id, thread_id)
+        )
         results = []
-        for comm in raw_comments:
-            if comm.get("visible"):
-                if comm.get("annotation"):
-                    if comm.get("annotation").get("highlight_section_ids"):
-                        section = get_section_bs(comm.get("annotation").get("highlight_section_ids")[0], thread_id=thread_id, document_html=document_html)
-                        if section is not None:
-                            if "img" in section.name:
-                                reference = section.get("alt")
-                            else:
-                                reference = clean_extracted_text(section.text) if section.text else None
-                        else:
-                            reference = None
-                    elif comm.get("annotation").get("id"):
-                        section = get_section_bs(comm.get("annotation").get("id"), thread_id=thread_id, document_html=document_html)
-                        reference = clean_extracted_text(section.text) if section.text is not None else None
-                else:
-                    reference = None
-                results.append({
-                    "reviewer": comm.get("author_name"),
-                    "comment_content": comm.get("text"),
-                    "comment_on": reference,
-                    "created:": datetime.datetime.fromtimestamp(comm.get("created_usec") / 1e6).ctime(),
-                    "last_updated": datetime.datetime.fromtimestamp(comm.get("updated_usec") / 1e6).ctime()
-                })
+        remaining = max_comments
+        while page:
+            oldest_usec = min(comm["created_usec"] for comm in page)
+            has_more = len(page) == count and (since is None or oldest_usec >= since)
+            # Hidden messages are not comments, so they don't count towards max_comments
+            visible = [comm for comm in page if comm.get("visible") and (since is None or comm["created_usec"] >= since)]
+            visible = visible[:remaining]
+            remaining -= len(visible)
+            next_page = None
+            if has_more and remaining > 0:
+                # Prefetch the next page while the current one is being formatted
+                count = min(remaining, MESSAGES_PAGE_SIZE)
+                next_page = asyncio.create_task(asyncio.to_thread(
+                    client.get_messages, thread_id, max_created_usec=oldest_usec - 1, count=count))
+            try:
+                results.extend(await asyncio.to_thread(format_comments, visible, sections_by_id))
+            except BaseException:
+                if next_page is not None:
+                    next_page.cancel()
+                raise
+            page = await next_page if next_page is not None else None
+        # Release the parsed document before encoding, so the tree and the JSON output are not held in memory together
+        del sections_by_id
+        return orjson.dumps(results).decode()
     except Exception as e:
         raise e
-    return json.dumps(results, ensure_ascii=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,210 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+import pytest
+
+import quip_mcp_server
+
+
+class FakeQuipClient:
+    """Stands in for the Quip client, serving a fixed thread and its messages."""
+
+    def __init__(self, document_html, messages):
+        self.document_html = document_html
+        self.messages = messages
+
+    def get_thread(self, id):
+        return {"html": self.document_html}
+
+    def get_messages(self, thread_id, max_created_usec=None, count=None):
+        messages = [m for m in self.messages if max_created_usec is None or m["created_usec"] <= max_created_usec]
+        return messages[:count]
+
+
+@pytest.mark.parametrize("document_html", ["\n", "   ", "<!-- x -->"])
+def test_comments_from_thread_without_document_elements(monkeypatch, document_html):
+    comment = {
+        "visible": True,
+        "author_name": "Reviewer",
+        "text": "Looks good",
+        "created_usec": 1700000000000000,
+        "updated_usec": 1700000000000000,
+    }
+    client = FakeQuipClient(document_html, [comment])
+    monkeypatch.setattr(quip_mcp_server, "init_quip_client", lambda: client)
+
+    results = orjson.loads(asyncio.run(quip_mcp_server.get_comments_from_thread("AbcCFHsxcstk")))
+
+    assert len(results) == 1
+    assert results[0]["reviewer"] == "Reviewer"
+    assert results[0]["comment_content"] == "Looks good"
+    assert results[0]["comment_on"] is None
+
+
+def make_caching_client(monkeypatch, responses):
+    client = quip_mcp_server.CachingQuipClient(access_token="token")
+    calls = []
+
+    def fetch_json(path, post_data=None, **args):
+        calls.append(path)
+        return responses(path)
+
+    monkeypatch.setattr(client, "_fetch_json", fetch_json)
+    return client, calls
+
+
+def test_caching_client_reuses_responses_until_invalidated(monkeypatch):
+    client, calls = make_caching_client(monkeypatch, lambda path: {"path": path})
+
+    client.get_thread("AbcCFHsxcstk")
+    client.get_thread("AbcCFHsxcstk")
+    client.get_messages("AbcCFHsxcstk", count=100)
+    client.get_messages("AbcCFHsxcstk", count=100)
+    assert calls == ["threads/AbcCFHsxcstk", "messages/AbcCFHsxcstk"]
+
+    client.invalidate_thread("AbcCFHsxcstk")
+    client.invalidate_thread("AbcCFHsxcstk")
+    client.get_thread("AbcCFHsxcstk")
+    assert calls == ["threads/AbcCFHsxcstk", "messages/AbcCFHsxcstk", "threads/AbcCFHsxcstk"]
+
+
+def test_caching_client_drops_response_fetched_across_invalidation(monkeypatch):
+    def responses(path):
+        # The thread is changed while this (now stale) response is in flight
+        client.invalidate_thread("AbcCFHsxcstk")
+        return {"access_levels": "stale"}
+
+    client, calls = make_caching_client(monkeypatch, responses)
+
+    assert client.get_thread("AbcCFHsxcstk") == {"access_levels": "stale"}
+    client.get_thread("AbcCFHsxcstk")
+    assert calls == ["threads/AbcCFHsxcstk", "threads/AbcCFHsxcstk"]
+
+
+def make_comments(count, hidden_every=None):
+    return [{
+        "visible": not (hidden_every and i % hidden_every == 0),
+        "author_name": "Reviewer",
+        "text": f"Comment {i}",
+        "created_usec": 1700000000000000 - i,
+        "updated_usec": 1700000000000000 - i,
+    } for i in range(count)]
+
+
+def test_comments_from_thread_counts_only_visible_comments(monkeypatch):
+    client = FakeQuipClient("<p id='a'>Section</p>", make_comments(250, hidden_every=3))
+    monkeypatch.setattr(quip_mcp_server, "init_quip_client", lambda: client)
+
+    results = orjson.loads(asyncio.run(quip_mcp_server.get_comments_from_thread("AbcCFHsxcstk", max_comments=120)))
+
+    assert len(results) == 120
+    assert len({r["comment_content"] for r in results}) == 120
+
+
+def test_comments_from_thread_cancels_prefetch_when_formatting_fails(monkeypatch):
+    client = FakeQuipClient("<p id='a'>Section</p>", make_comments(250))
+    monkeypatch.setattr(quip_mcp_server, "init_quip_client", lambda: client)
+
+    def fail(raw_comments, sections_by_id):
+        raise RuntimeError("formatting failed")
+
+    monkeypatch.setattr(quip_mcp_server, "format_comments", fail)
+    prefetches = []
+    create_task = asyncio.create_task
+
+    def track(coro):
+        task = create_task(coro)
+        prefetches.append(task)
+        return task
+
+    monkeypatch.setattr(quip_mcp_server.asyncio, "create_task", track)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(quip_mcp_server.get_comments_from_thread("AbcCFHsxcstk", max_comments=250))
+    assert len(prefetches) == 1
+    assert prefetches[0].cancelled()
+
+
+def test_init_quip_client_creates_one_client_for_concurrent_calls(monkeypatch):
+    created = []
+
+    def create_quip_client():
+        time.sleep(0.05)
+        created.append(object())
+        return created[-1]
+
+    monkeypatch.setattr(quip_mcp_server, "_quip_client", None)
+    monkeypatch.setattr(quip_mcp_server, "create_quip_client", create_quip_client)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: quip_mcp_server.init_quip_client(), range(8)))
+
+    assert len(created) == 1
+    assert all(client is created[0] for client in clients)
+
+
+def call_tool(name, arguments):
+    result = asyncio.run(quip_mcp_server.mcp.call_tool(name, arguments))
+    # Newer mcp releases return (content, structured_content)
+    content = result[0] if isinstance(result, tuple) else result
+    return orjson.loads(content[0].text)
+
+
+@pytest.mark.parametrize("convert", [int, str])
+def test_comments_tool_coerces_arguments_and_stops_at_since_across_pages(monkeypatch, convert):
+    client = FakeQuipClient("<p id='a'>Section</p>", make_comments(250))
+    monkeypatch.setattr(quip_mcp_server, "init_quip_client", lambda: client)
+    # Comment 150 is on the second page of 100
+    since = 1700000000000000 - 150
+
+    results = call_tool("get_comments_from_thread", {
+        "thread_id": "AbcCFHsxcstk",
+        "max_comments": convert(1000),
+        "since": convert(since),
+    })
+
+    assert [r["comment_content"] for r in results] == [f"Comment {i}" for i in range(151)]
+
+
+@pytest.mark.parametrize("convert", [int, str])
+def test_comments_tool_limits_comments_from_tool_arguments(monkeypatch, convert):
+    client = FakeQuipClient("<p id='a'>Section</p>", make_comments(250))
+    monkeypatch.setattr(quip_mcp_server, "init_quip_client", lambda: client)
+
+    results = call_tool("get_comments_from_thread", {"thread_id": "AbcCFHsxcstk", "max_comments": convert(3)})
+
+    assert [r["comment_content"] for r in results] == ["Comment 0", "Comment 1", "Comment 2"]
+
+
+def test_comment_reference_uses_first_section_with_repeated_id(monkeypatch):
+    comment = dict(make_comments(1)[0], annotation={"highlight_section_ids": ["d"]})
+    client = FakeQuipClient("<p id='d'>first</p><p id='d'>second</p>", [comment])
+    monkeypatch.setattr(quip_mcp_server, "init_quip_client", lambda: client)
+
+    results = orjson.loads(asyncio.run(quip_mcp_server.get_comments_from_thread("AbcCFHsxcstk")))
+
+    assert results[0]["comment_on"] == "first"
+
+
+@pytest.mark.parametrize("document_html", [
+    "<h1 id='a'>Title</h1><h2 id='b'>Sub</h2><h3 id='c'>Subsub</h3><p id='d'>Some <b>bold</b> and <i>italic</i> text.</p>",
+    "<ul id='a'><li id='b'>One</li><li id='c'>Two <a href='https://quip.com'>link</a></li></ul><ol id='d'><li id='e'>First</li></ol>",
+    "<table id='a'><thead><tr><th>Name</th><th>Value</th></tr></thead><tbody><tr><td>x</td><td>1</td></tr></tbody></table>",
+    "<pre id='a'>def f():\n    return 1\n</pre><p id='b'>After &amp; before</p>",
+    "<p id='a'>Picture: <img src='https://quip.com/blob/x' alt='diagram'></p>",
+    "<title>Doc title</title><h1 id='a'>Heading</h1><p id='b'>Body</p>",
+])
+def test_document_markdown_matches_markdownify(monkeypatch, document_html):
+    from markdownify import markdownify
+
+    class ThreadClient:
+        def get_thread(self, id):
+            return {"thread": {"id": id, "type": "document", "title": "Doc"}, "html": document_html}
+
+    monkeypatch.setattr(quip_mcp_server, "init_quip_client", lambda: ThreadClient())
+
+    content = orjson.loads(quip_mcp_server.get_document_content("AbcCFHsxcstk"))
+
+    assert content["thread_html_content"] == markdownify(document_html, heading_style="ATX")